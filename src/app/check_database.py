@@ -1,16 +1,79 @@
 import clickhouse_connect
 import logging
+import threading
 from typing import Optional
+from clickhouse_connect.driver.client import Client
+from clickhouse_connect.driver.httputil import get_pool_manager
 from app.config import Config
 from app.constants import (
-    CREATE_TRADES_TABLE_QUERY,
-    CREATE_ORDERS_TABLE_QUERY,
-    TABLE_NAME_TRADES,
-    TABLE_NAME_ORDERS,
-    LOG_FORMAT,
-    LOG_LEVEL,
+    CLICKHOUSE_POOL_MAXSIZE,
+    CLICKHOUSE_POOL_NUM_POOLS,
+    CLICKHOUSE_COMPRESSION,
+    DATE_COLUMN_KIND_QUERY,
 )
 
+# One HTTP pool for every checker instance, so retries reuse warm sockets
+_POOL = get_pool_manager(
+    maxsize=CLICKHOUSE_POOL_MAXSIZE, num_pools=CLICKHOUSE_POOL_NUM_POOLS
+)
+
+_SHARED_CLIENT: Optional[Client] = None
+# Checks run in worker threads, so guard the lazy initialization
+_SHARED_CLIENT_LOCK = threading.Lock()
+
+
+def get_shared_client(config: Config) -> Client:
+    """
+    Lazily create the process wide ClickHouse client used by DatabaseChecker.
+    get_client() connects to the server, so it runs outside the lock; only
+    publishing the client is locked, and a client that lost the race is closed.
+    """
+
+    global _SHARED_CLIENT
+    with _SHARED_CLIENT_LOCK:
+        if _SHARED_CLIENT is not None:
+            return _SHARED_CLIENT
+
+    clickhouse_config = config.clickhouse
+
+    # Extra validation so we fail fast if config is broken
+    if not (
+        clickhouse_config.ClickHouse_Host
+        and clickhouse_config.ClickHouse_Port
+        and clickhouse_config.ClickHouse_User
+        and clickhouse_config.ClickHouse_Password
+    ):
+        raise ValueError("Incomplete ClickHouse configuration")
+
+    client = clickhouse_connect.get_client(
+        host=clickhouse_config.ClickHouse_Host,
+        port=clickhouse_config.ClickHouse_Port,
+        username=clickhouse_config.ClickHouse_User,
+        password=clickhouse_config.ClickHouse_Password,
+        pool_mgr=_POOL,
+        compress=CLICKHOUSE_COMPRESSION,
+    )
+
+    with _SHARED_CLIENT_LOCK:
+        if _SHARED_CLIENT is None:
+            _SHARED_CLIENT = client
+            return client
+        shared = _SHARED_CLIENT
+    client.close()
+    return shared
+
+
+def close_shared_client() -> None:
+    """
+    Close the shared client; called once on application shutdown.
+    """
+
+    global _SHARED_CLIENT
+    with _SHARED_CLIENT_LOCK:
+        client, _SHARED_CLIENT = _SHARED_CLIENT, None
+    if client is not None:
+        client.close()
+
 
 class DatabaseChecker:
     """
@@ -21,51 +84,21 @@ class DatabaseChecker:
     def __init__(self, config: Config) -> None:
 
         self.config = config
-        self._client: Optional[clickhouse_connect.driver.client.Client] = None
-        self.logger = logging.getLogger("DatabaseChecker")
-        self.logger.setLevel(getattr(logging, LOG_LEVEL))
-        if not self.logger.handlers:
-            logging.basicConfig(
-                format=LOG_FORMAT, level=getattr(logging, LOG_LEVEL), force=True
-            )
+        self.logger = logging.getLogger(__name__)
 
-    def _get_client(self) -> clickhouse_connect.driver.client.Client:
+    def _get_client(self) -> Client:
         """
-        Lazily create a ClickHouse client using settings from the config.
+        Return the shared ClickHouse client, creating it on first use.
         """
 
-        if self._client is None:
-            clickhouse_config = self.config.clickhouse[0]
-
-            # Extra validation so we fail fast if config is broken
-            if not all(
-                [
-                    clickhouse_config.ClickHouse_Host,
-                    clickhouse_config.ClickHouse_Port,
-                    clickhouse_config.ClickHouse_User,
-                    clickhouse_config.ClickHouse_Password,
-                ]
-            ):
-                raise ValueError("Incomplete ClickHouse configuration")
-
-            self._client = clickhouse_connect.get_client(
-                host=clickhouse_config.ClickHouse_Host,
-                port=clickhouse_config.ClickHouse_Port,
-                username=clickhouse_config.ClickHouse_User,
-                password=clickhouse_config.ClickHouse_Password,
-            )
-
-        return self._client
+        return get_shared_client(self.config)
 
     def close_connection(self) -> None:
         """
-        Close the ClickHouse client if it has been created.
+        No-op: the shared client and its pool manage socket lifetime.
+        Use close_shared_client() on shutdown instead.
         """
 
-        if self._client is not None:
-            self._client.close()
-            self._client = None
-
     def test_database_connection(self) -> bool:
         """
         Simple health‑check query to verify that ClickHouse is reachable.
@@ -85,23 +118,41 @@ class DatabaseChecker:
 
     def check_and_create_trades_table(self) -> bool:
         """
-        Create target tables if they do not exist yet.
-        Chooses between trades and orders based on the collection flag.
+        Create the target table of the configured collection mode if it does not exist yet.
         """
 
         try:
             client = self._get_client()
-            if self.config.collection_config.flag == "trades":
-                client.command(CREATE_TRADES_TABLE_QUERY)
-                self.logger.info(f"The {TABLE_NAME_TRADES} table has been successfully created")
-            elif self.config.collection_config.flag == "orders":
-                client.command(CREATE_ORDERS_TABLE_QUERY)
-                self.logger.info(f"The {TABLE_NAME_ORDERS} table has been successfully created")
-            return True
+            client.command(self.config.mode.create_query)
+            self.logger.info(f"The {self.config.mode.table_name} table has been successfully created")
         except Exception as e:
-            self.logger.error(f"Error when working with the trades table: {e}")
+            self.logger.error(f"Error when working with the {self.config.mode.table_name} table: {e}")
             return False
 
+        self.migrate_date_column(client)
+        return True
+
+    def migrate_date_column(self, client: Client) -> None:
+        """
+        Make `date` MATERIALIZED on tables created before it was.
+        Skipped when it already is; a failure is only logged, since inserts
+        work either way and the collector should still start.
+        """
+
+        table_name = self.config.mode.table_name
+        database, table = table_name.split(".", 1)
+        try:
+            result = client.query(
+                DATE_COLUMN_KIND_QUERY, parameters={"database": database, "table": table}
+            )
+            if result.result_rows and result.result_rows[0][0] == "MATERIALIZED":
+                return
+            for query in self.config.mode.migrate_queries:
+                client.command(query)
+            self.logger.info(f"Migrated the date column of {table_name}")
+        except Exception as e:
+            self.logger.warning(f"Could not migrate the date column of {table_name}: {e}")
+
     def check_database(self) -> bool:
         """
         High‑level helper combining connection check and schema check.
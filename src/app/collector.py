@@ -1,19 +1,50 @@
-from binance.client import Client
+from binance import AsyncClient
+import aiohttp
 import asyncio
+import functools
+import operator
 import signal
 import time
 from app.config import Config
 import logging
 from app.writer import EventWriter
 from binance.exceptions import BinanceAPIException
-from app.check_database import DatabaseChecker
+from app.check_database import DatabaseChecker, close_shared_client
+from app.rate_limit import WeightLimiter
+from app.reliability import retry, backoff_delay, CircuitBreaker, CircuitOpenError
 from app.constants import (
-    MAX_DATABASE_RETRIES,
-    LOG_FORMAT,
-    LOG_LEVEL,
+    DATABASE_INIT_TIMEOUT,
+    DATABASE_RETRY_BASE,
+    DATABASE_RETRY_CAP,
+    BINANCE_PAGE_LIMIT,
+    WEIGHT_EXCHANGE_INFO,
+    API_MAX_RETRIES,
+    API_RETRY_BASE,
+    API_RETRY_CAP,
+    API_REQUEST_TIMEOUT,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    BINANCE_TOO_MANY_REQUESTS,
+    BINANCE_DISCONNECTED,
 )
 
 
+_TRADING = "TRADING"
+
+
+def _is_transient(e: Exception) -> bool:
+    """
+    Errors worth retrying: timeouts, dropped connections,
+    Binance 5xx responses and rate limit rejections.
+    """
+    if isinstance(e, BinanceAPIException):
+        return e.status_code >= 500 or e.code in (
+            BINANCE_TOO_MANY_REQUESTS,
+            BINANCE_DISCONNECTED,
+        )
+    return isinstance(e, (asyncio.TimeoutError, aiohttp.ClientError, ConnectionError))
+
+
 class Collector:
     """
     High‑level orchestrator:
@@ -22,61 +53,134 @@ class Collector:
 
     def __init__(self, conf: Config):
         self.conf = conf
-        self.logger = logging.getLogger("Collector")
-        self.logger.setLevel(getattr(logging, LOG_LEVEL))
-        if not self.logger.handlers:
-            logging.basicConfig(
-                format=LOG_FORMAT, level=getattr(logging, LOG_LEVEL), force=True
-            )
+        # Mode specific table, endpoint and writer, resolved once
+        self.mode = conf.mode
+        self.logger = logging.getLogger(__name__)
         # Used to stop long‑running loops gracefully from signal handlers
         self.stop_event = asyncio.Event()
         self.event_writer = None
         self.clients = {}
-        self.symbols = {}
-        self._register_signal_handlers()
+        self.symbols = ()
+        # (symbol, account) -> id to resume from; None means look up per pair
+        self.resume_points = None
+        # (symbol, account) -> next id to fetch, for pairs that made progress this run
+        self.cursors = {}
+        # Binance weight limits are per IP, so all accounts share one bucket
+        self.limiter = WeightLimiter()
+        self.breakers = {
+            cred.name: CircuitBreaker(
+                cred.name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+            )
+            for cred in conf.credentials
+        }
 
-    def _init_clients(self):
+    async def _init_clients(self):
         """
-        Create one Binance futures client per account in the config.
+        Create one async Binance futures client per account in the config.
+        If any of them fails, the ones already created are kept in self.clients
+        so aclose() still closes their HTTP sessions.
         """
-        self.clients = {}
-        for cred in self.conf.credentials:
-            self.clients[cred.name] = Client(
-                api_key=cred.api_key, api_secret=cred.api_secret,
-            )
+        created = await asyncio.gather(
+            *(
+                AsyncClient.create(api_key=cred.api_key, api_secret=cred.api_secret)
+                for cred in self.conf.credentials
+            ),
+            return_exceptions=True,
+        )
+        self.clients = {
+            cred.name: client
+            for cred, client in zip(self.conf.credentials, created)
+            if not isinstance(client, BaseException)
+        }
+        errors = [client for client in created if isinstance(client, BaseException)]
+        if errors:
+            raise errors[0]
         self.logger.info(f"Initialized {len(self.clients)} clients")
 
-    def _init_database_checker(self) -> bool:
+    async def _request(
+        self, breaker: CircuitBreaker, client: AsyncClient, call, weight: int, **params
+    ):
+        """
+        Run `call`, a bound method of `client`, with retries, guarded by the account's
+        circuit breaker. The breaker counts one failure per call, once its retries
+        are exhausted, so a short network blip does not open it.
+        """
+        breaker.check()
+        try:
+            result = await self._call(client, call, weight, **params)
+        except Exception as e:
+            if _is_transient(e):
+                breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+    @retry(
+        max_attempts=API_MAX_RETRIES,
+        base=API_RETRY_BASE,
+        cap=API_RETRY_CAP,
+        retry_if=_is_transient,
+    )
+    async def _call(self, client: AsyncClient, call, weight: int, **params):
+        """
+        Single attempt of a Binance call within the shared weight budget.
+        """
+        await self.limiter.acquire(weight)
+        try:
+            return await asyncio.wait_for(call(**params), timeout=API_REQUEST_TIMEOUT)
+        finally:
+            response = getattr(client, "response", None)
+            self.limiter.update_from_headers(getattr(response, "headers", None))
+
+    async def _init_database_checker(self) -> bool:
         """
         Make sure ClickHouse is reachable and target tables exist.
-        Uses simple exponential backoff to handle temporary outages.
+        Temporary outages are retried with capped, jittered backoff until
+        DATABASE_INIT_TIMEOUT runs out; the blocking ClickHouse calls run in a worker thread.
         """
-        retry_count = 0
-        while retry_count < MAX_DATABASE_RETRIES and not self.stop_event.is_set():
+        deadline = time.monotonic() + DATABASE_INIT_TIMEOUT
+        attempt = 0
+        while not self.stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
                 with DatabaseChecker(self.conf) as db_checker:
-                    if db_checker.check_database():
+                    # A hanging connect cannot be interrupted, but waiting for it can
+                    if await asyncio.wait_for(
+                        asyncio.to_thread(db_checker.check_database), remaining
+                    ):
                         self.logger.info("Database checked and created successfully")
                         return True
-                    else:
-                        self.logger.error(
-                            f"Database check failed (attempt {retry_count + 1}/{MAX_DATABASE_RETRIES})"
-                        )
-                        sleep_seconds = 1 if retry_count == 0 else pow(2, retry_count)
-                        time.sleep(sleep_seconds)
-                retry_count += 1
+                self.logger.error(f"Database check failed (attempt {attempt + 1})")
+            except asyncio.TimeoutError:
+                self.logger.error(f"Database check did not finish in time (attempt {attempt + 1})")
             except Exception as e:
-                self.logger.error(
-                    f"Database initialization error (attempt {retry_count + 1}/{MAX_DATABASE_RETRIES}): {e}"
-                )
-                sleep_seconds = 1 if retry_count == 0 else pow(2, retry_count)
-                retry_count += 1
-                time.sleep(sleep_seconds)
+                self.logger.error(f"Database initialization error (attempt {attempt + 1}): {e}")
+            sleep_seconds = min(
+                backoff_delay(attempt, DATABASE_RETRY_BASE, DATABASE_RETRY_CAP, jitter="equal"),
+                max(0.0, deadline - time.monotonic()),
+            )
+            await self._wait_for_stop(sleep_seconds)
+            attempt += 1
 
-        self.logger.error("Exceeded maximum database initialization retries")
+        if self.stop_event.is_set():
+            self.logger.info("Database initialization stopped")
+        else:
+            self.logger.error("Database initialization timed out")
         return False
 
-    def get_exchange_info(self):
+    async def _wait_for_stop(self, timeout: float) -> bool:
+        """
+        Sleep for up to `timeout` seconds, waking up early on shutdown.
+        """
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.stop_event.is_set()
+
+    async def get_exchange_info(self):
         """
         Discover active futures symbols from Binance.
         Only symbols with status=TRADING are used for historical backfill.
@@ -84,14 +188,22 @@ class Collector:
         while not self.stop_event.is_set():
             try:
                 base_set_account_symbols = self.conf.credentials[0].name
-                exchange_info = self.clients[
-                    base_set_account_symbols
-                ].futures_exchange_info()
-                active_symbols = [
-                    s["symbol"]
+                client = self.clients[base_set_account_symbols]
+                exchange_info = await self._request(
+                    self.breakers[base_set_account_symbols],
+                    client,
+                    client.futures_exchange_info,
+                    WEIGHT_EXCHANGE_INFO,
+                )
+                get_symbol = operator.itemgetter("symbol")
+                get_status = operator.itemgetter("status")
+                trading = _TRADING
+                # Symbols never change after discovery, so keep them in a tuple
+                active_symbols = tuple(
+                    get_symbol(s)
                     for s in exchange_info["symbols"]
-                    if s["status"] == "TRADING"
-                ]
+                    if get_status(s) == trading
+                )
                 if active_symbols:
                     self.symbols = active_symbols
                     self.logger.info("Symbols successfully received")
@@ -106,96 +218,159 @@ class Collector:
     async def get_futures_trade_history(self):
         """
         Backfill trades or orders for all configured accounts and symbols.
-        Resumes from the last id stored in ClickHouse to avoid duplicates.
+        Every (account, symbol) pair runs as its own task, bounded by a semaphore
+        so we stay within Binance request weight limits.
         """
-        try:
-            last_from_id = 0
-            last_order_id = 0
-            for cred in self.conf.credentials:
-                for symbol in self.symbols:
-                    try:
-                        if self.conf.collection_config.flag == "trades":
-                            last_from_id = await self.event_writer.get_last_from_id(
-                                    symbol, cred.name
-                                )
-                            self.logger.info(
-                                f"Fetching historical trades for {symbol} from {cred.name} from id: {last_from_id}"
-                            )
+        self.resume_points = await self.event_writer.get_last_ids(
+            [(symbol, cred.name) for cred in self.conf.credentials for symbol in self.symbols],
+            self.mode,
+        )
+
+        sem = asyncio.Semaphore(self.conf.collection_config.concurrency)
+        tasks = [
+            asyncio.create_task(
+                self._guarded(sem, cred, symbol),
+                name=f"Backfill {symbol} {cred.name}",
+            )
+            for cred in self.conf.credentials
+            for symbol in self.symbols
+        ]
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-                        elif self.conf.collection_config.flag == "orders":
-                            last_order_id = await self.event_writer.get_last_order_id(
-                                symbol, cred.name
+    async def _guarded(self, sem: asyncio.Semaphore, cred, symbol: str):
+        """
+        Run a single pair backfill once a semaphore slot is free.
+        Errors are logged here so one broken pair never stops the others;
+        pairs interrupted by an open circuit breaker or by a transient error that
+        outlasted its retries are resumed after the breaker's reset timeout.
+        """
+        wait = self.breakers[cred.name].reset_timeout
+        while True:
+            async with sem:
+                # Pairs still queued at shutdown are not started
+                if self.stop_event.is_set():
+                    return
+                try:
+                    await self._backfill(cred, symbol)
+                    return
+                except CircuitOpenError as e:
+                    self.logger.warning("%s, retrying %s in %ss", e, symbol, wait)
+
+                except Exception as e:
+                    if not _is_transient(e):
+                        if isinstance(e, BinanceAPIException):
+                            self.logger.error(
+                                "Binance API error %s: %s, for account name: %s",
+                                symbol, e, cred.name,
                             )
-                            self.logger.info(
-                                f"Fetching historical orders for {symbol} from {cred.name} from orderId: {last_order_id}"
+                        else:
+                            self.logger.error(
+                                "Unexpected error processing %s: %s, for account name: %s",
+                                symbol, e, cred.name,
                             )
+                        return
+                    self.logger.warning(
+                        "Transient error processing %s: %r, for account name: %s, retrying in %ss",
+                        symbol, e, cred.name, wait,
+                    )
 
-                        # Fetch and store data in 1000‑item pages until the API returns nothing
-                        while not self.stop_event.is_set():
-                            if self.conf.collection_config.flag == "trades":
-                                data_batch = self.clients[cred.name].futures_account_trades(
-                                    symbol=symbol, limit=1000, fromId=last_from_id
-                                )
-                            elif self.conf.collection_config.flag == "orders":
-                                data_batch = self.clients[cred.name].futures_get_all_orders(
-                                    symbol=symbol, limit=1000, orderId=last_order_id
-                                )
-
-                            if not data_batch:
-                                self.logger.info(
-                                    f"No more data {symbol}, for account {cred.name}"
-                                )
-                                break
-
-                            sz = len(data_batch)
-                            
-                            if self.conf.collection_config.flag == "trades":
-                                await self.event_writer.write_trades_batch(
-                                    data_batch, symbol, cred.name
-                                )
-                            elif self.conf.collection_config.flag == "orders":
-                                await self.event_writer.write_orders_batch(
-                                    data_batch, symbol, cred.name
-                                )
-
-                            # Binance returns at most 1000 items per call.
-                            # If we got a full page, there might be more data.
-                            if sz >= 1000:
-                                if self.conf.collection_config.flag == "trades":
-                                    self.logger.info(
-                                        f"Wrote batch for symbol {symbol} account {cred.name} size {sz}"
-                                    )
-                                    last_from_id = data_batch[-1]["id"] + 1
-
-                                elif self.conf.collection_config.flag == "orders":
-                                    self.logger.info(
-                                        f"Wrote batch for symbol {symbol} account {cred.name} size {sz}"
-                                    )
-                                    last_order_id = data_batch[-1]["orderId"] + 1
-                            else:
-                                self.logger.info(
-                                    f"Got batch for symbol {symbol} account {cred.name} size {sz}, exiting"
-                                )
-                                break
-
-                            await asyncio.sleep(1)
-                        if self.stop_event.is_set():
-                            return
-                    except BinanceAPIException as e:
-                        self.logger.error(
-                            f"Binance API error {symbol}: {e}, for account name: {cred.name}"
-                        )
-                        await asyncio.sleep(1)
-
-                    except Exception as e:
-                        self.logger.error(
-                            f"Unexpected error processing {symbol}: {e}, for account name: {cred.name}"
-                        )
-                        await asyncio.sleep(1)
-        except Exception as e:
-            self.logger.error(f"Error processing symbol {symbol}: {e}")
-            await asyncio.sleep(1)
+            # The account is cooling down: wait outside the semaphore so other
+            # accounts keep their slots, then resume this pair where it stopped
+            if await self._wait_for_stop(wait):
+                return
+
+    async def _resume_id(self, symbol: str, account_name: str) -> int:
+        """
+        Id to resume from: the cursor of an interrupted run of this pair,
+        then the prefetched map when available, otherwise queried for this single pair.
+        """
+        key = (symbol, account_name)
+        if key in self.cursors:
+            return self.cursors[key]
+        if self.resume_points is not None:
+            return self.resume_points.get(key, 0)
+        get_last = getattr(self.event_writer, self.mode.resume_fn_name)
+        return await get_last(symbol, account_name)
+
+    async def _backfill(self, cred, symbol: str):
+        """
+        Page through trades or orders of one (account, symbol) pair.
+        Resumes from the last id stored in ClickHouse to avoid duplicates.
+        """
+        mode = self.mode
+        client = self.clients[cred.name]
+        # Breaker, client and endpoint are resolved once per pair, not per page
+        fetch = functools.partial(
+            self._request,
+            self.breakers[cred.name],
+            client,
+            getattr(client, mode.fetcher_name),
+            mode.fetch_weight,
+        )
+        write = getattr(self.event_writer, mode.writer_name)
+        last_id = await self._resume_id(symbol, cred.name)
+        self.logger.info(
+            "Fetching historical %s for %s from %s from %s: %d",
+            mode.name, symbol, cred.name, mode.id_field, last_id,
+        )
+        await self._pipeline_pages(
+            cred, symbol, fetch, write, mode.id_field, mode.cursor_param, last_id
+        )
 
+    async def _pipeline_pages(
+        self, cred, symbol: str, fetch, write, id_key: str, cursor_param: str, last_id: int
+    ):
+        """
+        Fetch and store data in 1000‑item pages until the API returns nothing.
+        The request for the next page is in flight while the current page is written,
+        so Binance latency hides behind the ClickHouse insert.
+        Pacing is handled by the weight limiter inside _call.
+        """
+        key = (symbol, cred.name)
+
+        prev_write = None
+        next_fetch = asyncio.create_task(
+            fetch(symbol=symbol, limit=BINANCE_PAGE_LIMIT, **{cursor_param: last_id})
+        )
+        try:
+            while next_fetch is not None and not self.stop_event.is_set():
+                data_batch = await next_fetch
+                next_fetch = None
+                if not data_batch:
+                    self.logger.info("No more data %s, for account %s", symbol, cred.name)
+                    break
+
+                sz = len(data_batch)
+                last_id = data_batch[-1][id_key] + 1
+                # Where a retry of this pair picks up if it gets interrupted
+                self.cursors[key] = last_id
+                # Binance returns at most 1000 items per call.
+                # If we got a full page, there might be more data.
+                if sz >= BINANCE_PAGE_LIMIT:
+                    next_fetch = asyncio.create_task(
+                        fetch(symbol=symbol, limit=BINANCE_PAGE_LIMIT, **{cursor_param: last_id})
+                    )
+                    self.logger.info(
+                        "Got batch for symbol %s account %s size %d", symbol, cred.name, sz
+                    )
+                else:
+                    self.logger.info(
+                        "Got batch for symbol %s account %s size %d, exiting",
+                        symbol, cred.name, sz,
+                    )
+
+                # Hand pages to the writer one at a time so they are queued,
+                # and therefore inserted, in fetch order. Shielded so shutdown
+                # cannot abort the previous page's enqueue half way; if it lands
+                # here, the current page is not queued and the next run fetches it again
+                if prev_write is not None:
+                    await asyncio.shield(prev_write)
+                prev_write = asyncio.create_task(write(data_batch, symbol, cred.name))
+        finally:
+            if next_fetch is not None:
+                next_fetch.cancel()
+            if prev_write is not None:
+                await prev_write
 
     async def start_async(self):
         """
@@ -204,28 +379,36 @@ class Collector:
 
         self.logger.warning("Starting collector")
 
-        self._init_clients()
-        if not self._init_database_checker():
-            self.stop()
-            self.logger.info("Collector stopped due to database initialization failure")
-            return
+        self._register_signal_handlers()
+        try:
+            await self._init_clients()
+            if not await self._init_database_checker():
+                self.stop()
+                self.logger.info("Collector stopped due to database initialization failure")
+                return
 
-        self.event_writer = EventWriter(self.conf)
+            self.event_writer = EventWriter(self.conf)
 
-        # Discover the list of tradable symbols once before backfill
-        self.get_exchange_info()
+            # Discover the list of tradable symbols once before backfill
+            await self.get_exchange_info()
 
-        await self._async_cycle()
-        if not self.stop_event.is_set():
-            self.stop()
+            await self._async_cycle()
+            if not self.stop_event.is_set():
+                self.stop()
+        finally:
+            await self.aclose()
         self.logger.info("Collector stopped")
 
     async def _async_cycle(self):
         """
         Wrap the main long‑running tasks into asyncio primitives.
         If more tasks appear in the future, they should be added here.
+        On stop() the tasks are cancelled, which aborts in-flight requests,
+        retry backoffs and rate limit waits instead of finishing them;
+        pages already handed to the writer are still flushed by aclose().
         """
         tasks = []
+        stop_wait = asyncio.create_task(self.stop_event.wait())
         try:
             tasks.append(
                 asyncio.create_task(
@@ -233,11 +416,22 @@ class Collector:
                 )
             )
 
-            await asyncio.gather(*tasks, return_exceptions=True)
+            gathered = asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.wait(
+                (gathered, stop_wait), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not gathered.done():
+                for task in tasks:
+                    task.cancel()
+            for task, result in zip(tasks, await gathered):
+                if isinstance(result, Exception):
+                    self.logger.error("%s failed: %s", task.get_name(), result)
 
         except Exception as e:
             self.logger.error(f"Error collecting data: {e}")
             raise
+        finally:
+            stop_wait.cancel()
 
         self.logger.info("Trades collection cycle stopped")
 
@@ -248,17 +442,41 @@ class Collector:
         self.logger.info("Stopping collector...")
         if self.stop_event:
             self.stop_event.set()
-        if hasattr(self, "event_writer") and self.event_writer:
-            self.event_writer.close()
+
+    async def aclose(self):
+        """
+        Flush buffered writes and close HTTP sessions of all Binance clients.
+        stop() may run from a signal handler, so the async part lives here
+        and is awaited by start_async once the work is done.
+        """
+        if self.event_writer:
+            await self.event_writer.aclose()
+            self.event_writer = None
+        # Closing the shared ClickHouse client is blocking I/O; keep it off the loop
+        await asyncio.to_thread(close_shared_client)
+        for name, client in self.clients.items():
+            try:
+                await client.close_connection()
+            except Exception as e:
+                self.logger.warning(f"Failed to close Binance client {name}: {e}")
+        self.clients = {}
 
     def _register_signal_handlers(self):
         """
-        Register basic OS signal handlers to allow Ctrl+C / SIGTERM shutdown.
+        Register OS signal handlers to allow Ctrl+C / SIGTERM shutdown.
+        Handlers are attached to the running loop so stop() runs in the loop thread;
+        platforms without add_signal_handler (Windows) fall back to signal.signal.
         """
+        signals = [signal.SIGINT]
+        if hasattr(signal, "SIGTERM"):
+            signals.append(signal.SIGTERM)
         try:
-            signal.signal(signal.SIGINT, lambda *_: self.stop())
-            if hasattr(signal, "SIGTERM"):
-                signal.signal(signal.SIGTERM, lambda *_: self.stop())
+            loop = asyncio.get_running_loop()
+            for sig in signals:
+                try:
+                    loop.add_signal_handler(sig, self.stop)
+                except NotImplementedError:
+                    signal.signal(sig, lambda *_: loop.call_soon_threadsafe(self.stop))
             self.logger.info("Registered signal handlers")
         except Exception as e:
             self.logger.warning(f"Failed to register signal handlers: {e}")
@@ -1,8 +1,9 @@
-from typing import Dict
+from typing import Dict, List
 from dataclasses import dataclass
 import logging
+from app.constants import BACKFILL_CONCURRENCY, MODES
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Credentials:
     """
     Single Binance account used for collection.
@@ -12,7 +13,7 @@ class Credentials:
     name: str
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ClickHouse:
     """
     Minimal ClickHouse connection settings.
@@ -23,12 +24,14 @@ class ClickHouse:
     ClickHouse_Password: str
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CollectionConfig:
     """
     Which kind of data we collect in this run: 'trades' or 'orders'.
     """
     flag: str
+    # How many (account, symbol) pairs are backfilled at the same time
+    concurrency: int = BACKFILL_CONCURRENCY
 
 
 class Config:
@@ -55,20 +58,34 @@ class Config:
 
         # Basic sanity check for each account
         for cred in self.credentials:
-            if not all([cred.api_key, cred.api_secret, cred.name]):
+            if not (cred.api_key and cred.api_secret and cred.name):
                 raise ValueError(f"Неполные данные для credentials: {cred.name}")
 
         # Map flat dict into a tiny dataclass so the rest of the code
         # does not depend on raw JSON structure
         clickhouse_section = conf.get("clickhouse", {})
-        self.clickhouse = [
-            ClickHouse(
-                ClickHouse_Host=clickhouse_section.get("host", "localhost"),
-                ClickHouse_Port=int(clickhouse_section.get("port", 8123)),
-                ClickHouse_User=clickhouse_section.get("user", "default"),
-                ClickHouse_Password=clickhouse_section.get("password", "password123"),
-            )
-        ]
-        logging.warning(f"Got host {self.clickhouse[0].ClickHouse_Host}")
+        self.clickhouse: ClickHouse = ClickHouse(
+            ClickHouse_Host=clickhouse_section.get("host", "localhost"),
+            ClickHouse_Port=int(clickhouse_section.get("port", 8123)),
+            ClickHouse_User=clickhouse_section.get("user", "default"),
+            ClickHouse_Password=clickhouse_section.get("password", "password123"),
+        )
+        logging.warning(f"Got host {self.clickhouse.ClickHouse_Host}")
         
-        self.collection_config = CollectionConfig(flag=collection_type)
\ No newline at end of file
+        if collection_type not in MODES:
+            raise ValueError(f"Unknown collection type: {collection_type}")
+        self.mode = MODES[collection_type]
+        concurrency = int(conf.get("backfill_concurrency", BACKFILL_CONCURRENCY))
+        if concurrency < 1:
+            raise ValueError(f"backfill_concurrency must be at least 1, got {concurrency}")
+        self.collection_config = CollectionConfig(
+            flag=collection_type,
+            concurrency=concurrency,
+        )
+
+    @property
+    def clickhouse_list(self) -> List[ClickHouse]:
+        """
+        Old list-shaped view of the ClickHouse settings, kept for compatibility.
+        """
+        return [self.clickhouse]
\ No newline at end of file
@@ -2,9 +2,13 @@
 Constants used across the trades collector project.
 """
 
+from dataclasses import dataclass
+
 # Retry settings
-MAX_DATABASE_RETRIES = 5
 DATABASE_RETRY_DELAY = 5  # seconds
+DATABASE_INIT_TIMEOUT = 120  # seconds to keep retrying ClickHouse at startup
+DATABASE_RETRY_BASE = 2.0  # seconds; startup backoff between ClickHouse checks
+DATABASE_RETRY_CAP = 15.0  # seconds
 
 # Logging settings
 LOG_FORMAT = "%(asctime)s %(levelname)s %(filename)s:%(lineno)d %(message)s"
@@ -12,14 +16,87 @@ LOG_LEVEL = "INFO"
 
 # API settings
 API_RETRY_DELAY = 5
+API_MAX_RETRIES = 5
+API_RETRY_BASE = 1.0  # seconds
+API_RETRY_CAP = 30.0  # seconds
+API_REQUEST_TIMEOUT = 30  # seconds
+# Counted per call after its retries, and kept above the retry budget and the default
+# concurrency so a short blip hitting every in-flight pair does not open the breaker
+CIRCUIT_FAILURE_THRESHOLD = 10
+CIRCUIT_RESET_TIMEOUT = 60  # seconds
+BINANCE_TOO_MANY_REQUESTS = -1003
+BINANCE_DISCONNECTED = -1001
+BACKFILL_CONCURRENCY = 8  # parallel (account, symbol) backfills
+BINANCE_PAGE_LIMIT = 1000  # max items Binance returns per history call
+
+# Binance futures request weight (per IP, per minute) and endpoint costs
+BINANCE_WEIGHT_LIMIT_1M = 2400
+WEIGHT_EXCHANGE_INFO = 1
+WEIGHT_ACCOUNT_TRADES = 5
+WEIGHT_ALL_ORDERS = 5
 
 # DB connection settings
 MAX_CLIENTS = 1
 
+# Write buffering: pages from all symbols/accounts are merged into large inserts
+WRITER_FLUSH_ROWS = 50_000  # flush a table once this many rows are buffered
+WRITER_FLUSH_INTERVAL = 5.0  # seconds; upper bound on how long rows wait
+WRITER_QUEUE_SIZE = 100  # pages; producers wait when the flusher falls behind
+CLICKHOUSE_POOL_MAXSIZE = 16
+CLICKHOUSE_POOL_NUM_POOLS = 4
+CLICKHOUSE_COMPRESSION = "lz4"
+
 # Table names
 TABLE_NAME_TRADES = "binance.trades"
 TABLE_NAME_ORDERS = "binance.orders"
 
+# Insert column layout (name, ClickHouse type); order matches the row transforms in EventWriter.
+# `date` is not listed: ClickHouse materializes it from `time`.
+TRADES_COLUMNS = (
+    ("buyer", "Bool"),
+    ("commission", "Float64"),
+    ("commissionAsset", "LowCardinality(String)"),
+    ("id", "UInt64"),
+    ("price", "Float64"),
+    ("qty", "Float64"),
+    ("quoteQTY", "Float64"),
+    ("realizedPnl", "Float64"),
+    ("positionSide", "LowCardinality(String)"),
+    ("symbol", "LowCardinality(String)"),
+    ("name", "LowCardinality(String)"),
+    ("time", "UInt128"),
+)
+
+ORDERS_COLUMNS = (
+    ("avgPrice", "Float64"),
+    ("clientOrderId", "String"),
+    ("cumQuote", "Float64"),
+    ("executedQty", "Float64"),
+    ("orderId", "UInt64"),
+    ("origQty", "Float64"),
+    ("origType", "LowCardinality(String)"),
+    ("price", "Float64"),
+    ("reduceOnly", "Bool"),
+    ("side", "LowCardinality(String)"),
+    ("positionSide", "LowCardinality(String)"),
+    ("status", "LowCardinality(String)"),
+    ("stopPrice", "Float64"),
+    ("closePosition", "Bool"),
+    ("symbol", "LowCardinality(String)"),
+    ("time", "UInt64"),
+    ("timeInForce", "LowCardinality(String)"),
+    ("type", "LowCardinality(String)"),
+    ("activatePrice", "Float64"),
+    ("priceRate", "Float64"),
+    ("updateTime", "UInt64"),
+    ("workingType", "LowCardinality(String)"),
+    ("priceProtect", "Bool"),
+    ("priceMatch", "LowCardinality(String)"),
+    ("selfTradePreventionMode", "LowCardinality(String)"),
+    ("goodTillDate", "UInt64"),
+    ("name", "LowCardinality(String)"),
+)
+
 CREATE_ORDERS_TABLE_QUERY = """
 CREATE TABLE IF NOT EXISTS binance.orders on cluster "default"(
     avgPrice Float64,
@@ -49,12 +126,19 @@ CREATE TABLE IF NOT EXISTS binance.orders on cluster "default"(
     selfTradePreventionMode LowCardinality(String),
     goodTillDate UInt64,
     name LowCardinality(String),
-    date DateTime
+    date DateTime MATERIALIZED toDateTime(intDiv(time, 1000))
 ) ENGINE = ReplicatedMergeTree()
 PARTITION BY toYYYYMM(date)
 ORDER BY date
 """
 
+# Tables created before `date` became MATERIALIZED get the expression added in place.
+# The column type stays DateTime: it is the partition/sort key, so its type cannot be altered.
+MIGRATE_ORDERS_DATE_QUERY = """
+ALTER TABLE binance.orders on cluster "default"
+MODIFY COLUMN date DateTime MATERIALIZED toDateTime(intDiv(time, 1000))
+"""
+
 CREATE_TRADES_TABLE_QUERY = """
 CREATE TABLE IF NOT EXISTS binance.trades on cluster "default" (
     buyer Boolean,
@@ -69,8 +153,66 @@ CREATE TABLE IF NOT EXISTS binance.trades on cluster "default" (
     symbol LowCardinality(String),
     name LowCardinality(String),
     time UInt128,
-    date DateTime
+    date DateTime MATERIALIZED toDateTime(intDiv(time, 1000))
 ) ENGINE = ReplicatedMergeTree()
 PARTITION BY toYYYYMM(date)
 ORDER BY date
 """
+
+MIGRATE_TRADES_DATE_QUERY = """
+ALTER TABLE binance.trades on cluster "default"
+MODIFY COLUMN date DateTime MATERIALIZED toDateTime(intDiv(time, 1000))
+"""
+
+# The migrations above are distributed DDL, so they only run while this still
+# reports a non MATERIALIZED `date` column
+DATE_COLUMN_KIND_QUERY = """
+SELECT default_kind
+FROM system.columns
+WHERE database = {database:String} AND table = {table:String} AND name = 'date'
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class ModeSpec:
+    """
+    Everything that differs between collection modes, resolved once at startup.
+    """
+    name: str
+    table_name: str
+    create_query: str
+    migrate_queries: tuple  # DDL making `date` MATERIALIZED on tables created before it was
+    id_field: str  # id column in the table and key in Binance payloads
+    cursor_param: str  # Binance request parameter used for pagination
+    fetcher_name: str  # AsyncClient method returning one page
+    fetch_weight: int
+    writer_name: str  # EventWriter method storing one page
+    resume_fn_name: str  # EventWriter method returning the per-pair resume id
+
+
+MODES = {
+    "trades": ModeSpec(
+        name="trades",
+        table_name=TABLE_NAME_TRADES,
+        create_query=CREATE_TRADES_TABLE_QUERY,
+        migrate_queries=(MIGRATE_TRADES_DATE_QUERY,),
+        id_field="id",
+        cursor_param="fromId",
+        fetcher_name="futures_account_trades",
+        fetch_weight=WEIGHT_ACCOUNT_TRADES,
+        writer_name="write_trades_batch",
+        resume_fn_name="get_last_from_id",
+    ),
+    "orders": ModeSpec(
+        name="orders",
+        table_name=TABLE_NAME_ORDERS,
+        create_query=CREATE_ORDERS_TABLE_QUERY,
+        migrate_queries=(MIGRATE_ORDERS_DATE_QUERY,),
+        id_field="orderId",
+        cursor_param="orderId",
+        fetcher_name="futures_get_all_orders",
+        fetch_weight=WEIGHT_ALL_ORDERS,
+        writer_name="write_orders_batch",
+        resume_fn_name="get_last_order_id",
+    ),
+}
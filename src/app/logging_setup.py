@@ -0,0 +1,13 @@
+import logging
+from app.constants import LOG_FORMAT, LOG_LEVEL
+
+# Numeric level resolved once at import instead of on every constructor call
+LEVEL = getattr(logging, LOG_LEVEL)
+
+
+def configure_logging() -> None:
+    """
+    Configure the root logger once at program startup.
+    Classes only ask for their own logger via logging.getLogger(__name__).
+    """
+    logging.basicConfig(format=LOG_FORMAT, level=LEVEL)
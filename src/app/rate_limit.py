@@ -0,0 +1,57 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Mapping, Optional
+from app.constants import BINANCE_WEIGHT_LIMIT_1M
+
+
+class WeightLimiter:
+    """
+    Token bucket for Binance request weight.
+    Refills continuously up to the per-minute limit and re-syncs with the
+    X-MBX-USED-WEIGHT-1M header returned by the exchange.
+    """
+
+    def __init__(
+        self,
+        capacity: int = BINANCE_WEIGHT_LIMIT_1M,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._rate = capacity / 60.0
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    async def acquire(self, weight: int = 1) -> None:
+        """
+        Wait until `weight` tokens are available and take them.
+        """
+        async with self._lock:
+            self._refill()
+            while self._tokens < weight:
+                await self._sleep((weight - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= weight
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """
+        Never trust the local bucket more than the exchange:
+        if Binance reports more used weight than we think, shrink the bucket.
+        """
+        if not headers:
+            return
+        used = headers.get("X-MBX-USED-WEIGHT-1M") or headers.get("x-mbx-used-weight-1m")
+        if used is None:
+            return
+        self._refill()
+        self._tokens = min(self._tokens, float(self.capacity - int(used)))
@@ -0,0 +1,142 @@
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(
+    attempt: int, base: float = 1.0, cap: float = 30.0, jitter: Optional[str] = "full"
+) -> float:
+    """
+    Capped exponential backoff for the given (zero based) attempt.
+    With "full" jitter the delay is drawn uniformly from [0, min(cap, base * 2**attempt)],
+    with "equal" jitter from its upper half, so there is always some pause.
+    """
+    delay = min(cap, base * (2**attempt))
+    if jitter == "full":
+        return random.uniform(0, delay)
+    if jitter == "equal":
+        return delay * (0.5 + random.random() * 0.5)
+    return delay
+
+
+def retry(
+    max_attempts: int = 5,
+    base: float = 1.0,
+    cap: float = 30.0,
+    jitter: Optional[str] = "full",
+    retry_if: Callable[[Exception], bool] = lambda e: True,
+    sleep: Callable[[float], None] = time.sleep,
+    async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+):
+    """
+    Retry a sync or async callable with capped exponential backoff.
+    Exceptions rejected by `retry_if` and the last failure are re-raised as is.
+    `sleep`/`async_sleep` wait out the backoff; tests pass fakes.
+    """
+
+    def decorator(func):
+        def _should_retry(attempt: int, e: Exception) -> bool:
+            return attempt + 1 < max_attempts and retry_if(e)
+
+        def _log(attempt: int, e: Exception, delay: float) -> None:
+            logger.warning(
+                f"{func.__qualname__} failed (attempt {attempt + 1}/{max_attempts}): {e}, "
+                f"retrying in {delay:.2f}s"
+            )
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                attempt = 0
+                while True:
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        if not _should_retry(attempt, e):
+                            raise
+                        delay = backoff_delay(attempt, base, cap, jitter)
+                        _log(attempt, e, delay)
+                        await async_sleep(delay)
+                        attempt += 1
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if not _should_retry(attempt, e):
+                        raise
+                    delay = backoff_delay(attempt, base, cap, jitter)
+                    _log(attempt, e, delay)
+                    sleep(delay)
+                    attempt += 1
+
+        return sync_wrapper
+
+    return decorator
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is rejected because its circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Per-account circuit breaker.
+    CLOSED -> OPEN after `failure_threshold` consecutive failures,
+    OPEN -> HALF_OPEN after `reset_timeout` seconds, and back to CLOSED on success.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self._clock = clock
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def check(self) -> None:
+        """
+        Fail fast while open; let a trial call through once the timeout passed.
+        """
+        if self.state == self.OPEN:
+            if self._clock() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            self.state = self.HALF_OPEN
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.error(f"Circuit for {self.name} opened after {self._failures} failures")
+            self.state = self.OPEN
+            self._opened_at = self._clock()
@@ -1,37 +1,110 @@
+import asyncio
 import clickhouse_connect
+import itertools
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from clickhouse_connect.driver.httputil import get_pool_manager
 from app.config import Config
-from app.constants import TABLE_NAME_TRADES, TABLE_NAME_ORDERS, LOG_FORMAT, LOG_LEVEL
+from app.constants import (
+    TABLE_NAME_TRADES,
+    TABLE_NAME_ORDERS,
+    TRADES_COLUMNS,
+    ORDERS_COLUMNS,
+    CLICKHOUSE_COMPRESSION,
+    WRITER_FLUSH_ROWS,
+    WRITER_FLUSH_INTERVAL,
+    WRITER_QUEUE_SIZE,
+    ModeSpec,
+)
+
+TRADES_COLUMN_NAMES = [name for name, _ in TRADES_COLUMNS]
+TRADES_COLUMN_TYPES = [type_name for _, type_name in TRADES_COLUMNS]
+ORDERS_COLUMN_NAMES = [name for name, _ in ORDERS_COLUMNS]
+ORDERS_COLUMN_TYPES = [type_name for _, type_name in ORDERS_COLUMNS]
+
+
+def _float_column(data: List[Dict[str, Any]], key: str) -> np.ndarray:
+    # Binance sends decimals as strings; numpy parses the whole column in one call
+    return np.array([item.get(key, 0.0) for item in data], dtype=np.float64)
+
+
+def _uint_column(data: List[Dict[str, Any]], key: str) -> np.ndarray:
+    return np.array([item.get(key, 0) for item in data], dtype=np.uint64)
+
+
+def _time_column(data: List[Dict[str, Any]]) -> List[int]:
+    # Raw millisecond time; ClickHouse derives `date` from it.
+    # Kept as plain ints: the UInt128 serializer expects Python ints.
+    _int = int
+    return [_int(item.get("time", 0)) for item in data]
+
+
+def _concat_columns(batches: List[List[Any]]) -> List[Any]:
+    """
+    Glue several column-oriented pages into one, column by column.
+    """
+    columns = []
+    for parts in zip(*batches):
+        if isinstance(parts[0], np.ndarray):
+            columns.append(np.concatenate(parts))
+        else:
+            columns.append(list(itertools.chain.from_iterable(parts)))
+    return columns
+
+
+# Queue item telling the flusher to write everything and exit
+_CLOSE = object()
+
+
+class FlushError(Exception):
+    """
+    Raised for pages of a table whose earlier flush failed.
+    Writes to that table stop, so no later rows land past the missing ones
+    and the next run resumes from the last id that was really stored.
+    """
 
 
 class EventWriter:
     """
     Writes trades and orders into ClickHouse in bulk.
-    Keeps a single client instance and exposes small async helpers for the collector.
+    Keeps a single client instance and exposes async helpers for the collector.
     """
     def __init__(self, config: Config):
         self.config = config
-        self.logger = logging.getLogger("EventWriter")
-        self.logger.setLevel(getattr(logging, LOG_LEVEL))
-        if not self.logger.handlers:
-            logging.basicConfig(
-                format=LOG_FORMAT, level=getattr(logging, LOG_LEVEL), force=True
-            )
+        self.logger = logging.getLogger(__name__)
         # ClickHouse client is created once and reused across all write calls
         self.client = None
+        self._pool_mgr = None
         self._init_clickhouse_client()
+        # Pages are buffered and flushed by a background task in large inserts
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        # At most one insert runs at a time, so pages land in queue order
+        self._inflight: Optional[asyncio.Task] = None
+        # table -> error of the flush that stopped writes to it
+        self._failed: Dict[str, Exception] = {}
+        self._inserters = {
+            TABLE_NAME_TRADES: self._async_write_trades,
+            TABLE_NAME_ORDERS: self._async_write_orders,
+        }
 
     def _init_clickhouse_client(self):
         try:
-            # At the moment we expect a single ClickHouse target and take the first one
-            clickhouse_config = self.config.clickhouse[0]
+            clickhouse_config = self.config.clickhouse
+            # Two connections: the insert in flight and a resume query may overlap
+            self._pool_mgr = get_pool_manager(maxsize=2, num_pools=1, block=False)
             self.client = clickhouse_connect.get_client(
                 host=clickhouse_config.ClickHouse_Host,
                 port=clickhouse_config.ClickHouse_Port,
                 username=clickhouse_config.ClickHouse_User,
                 password=clickhouse_config.ClickHouse_Password,
+                pool_mgr=self._pool_mgr,
+                # Writes and queries run concurrently from worker threads;
+                # a shared session id would make ClickHouse reject them as "session locked"
+                autogenerate_session_id=False,
+                # Insert blocks are LZ4 compressed before they are POSTed
+                compress=CLICKHOUSE_COMPRESSION,
             )
             self.logger.info("ClickHouse client initialized successfully")
         except Exception as e:
@@ -47,66 +120,53 @@ class EventWriter:
             return
 
         try:
-            rows = []
-            # Transform raw Binance trades into a flat structure expected by ClickHouse
-            for trade in trades_data:
-
-                row = {
-                    "buyer": trade.get("buyer", False),
-                    "commission": float(trade.get("commission", 0.0)),
-                    "commissionAsset": trade.get("commissionAsset", ""),
-                    "id": int(trade.get("id", 0)),
-                    "price": float(trade.get("price", 0.0)),
-                    "qty": float(trade.get("qty", 0.0)),
-                    "quoteQTY": float(trade.get("quoteQty", 0.0)),
-                    "realizedPnl": float(trade.get("realizedPnl", 0.0)),
-                    "positionSide": trade.get("positionSide", ""),
-                    "symbol": symbol,
-                    "name": account_name,
-                    "time": int(trade.get("time", 0)),
-                    # Store a human‑readable timestamp alongside the raw millisecond value
-                    "date": datetime.fromtimestamp(
-                        int(trade.get("time", 0)) / 1000
-                    ).strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                rows.append(row)
-
-            await self._async_write_trades(rows)
-
-            self.logger.info(
-                f"Successfully wrote {len(rows)} trades for {symbol} from {account_name}"
-            )
-
+            n = len(trades_data)
+            times = _time_column(trades_data)
+            # Transform raw Binance trades into one array per column (TRADES_COLUMNS order),
+            # which is the layout clickhouse-connect serializes natively
+            columns = [
+                [t.get("buyer", False) for t in trades_data],
+                _float_column(trades_data, "commission"),
+                [t.get("commissionAsset", "") for t in trades_data],
+                _uint_column(trades_data, "id"),
+                _float_column(trades_data, "price"),
+                _float_column(trades_data, "qty"),
+                _float_column(trades_data, "quoteQty"),
+                _float_column(trades_data, "realizedPnl"),
+                [t.get("positionSide", "") for t in trades_data],
+                [symbol] * n,
+                [account_name] * n,
+                times,
+            ]
+
+            await self._enqueue(TABLE_NAME_TRADES, columns, n)
+
+            # Per page, so DEBUG only; flushes report the aggregated row count
+            self.logger.debug("Queued %d trades for %s from %s", n, symbol, account_name)
+
+        except FlushError:
+            raise
         except Exception as e:
+            # A skipped page would leave a gap behind later pages of the pair,
+            # so stop the pair instead and let the next run resume before it
             self.logger.error(f"Error writing trades batch for {symbol}: {e}")
-
-    async def _async_write_trades(self, rows: List[Dict[str, Any]]):
-        try:
-            # We build a single INSERT statement instead of one query per row
-            if self.client and rows:
-                values_parts = []
-                for row in rows:
-                    value_part = f"({str(row['buyer']).lower()}, {row['commission']}, '{row['commissionAsset']}', {row['id']}, {row['price']}, {row['qty']}, {row['quoteQTY']}, {row['realizedPnl']}, '{row['positionSide']}', '{row['symbol']}', '{row['name']}', {row['time']}, '{row['date']}')"
-                    values_parts.append(value_part)
-
-                insert_sql = f"""
-                INSERT INTO {TABLE_NAME_TRADES} (
-                    buyer, commission, commissionAsset, id, price, qty, quoteQTY, 
-                    realizedPnl, positionSide, symbol, name, time, date
-                ) VALUES {', '.join(values_parts)}
-                """
-
-                self.logger.info(f"Executing batch insert for {len(rows)} rows")
-                _ = self.client.command(insert_sql)
-                self.logger.info(f"Successful batch insert. Processed {len(rows)} rows.")
-
-        except Exception as e:
-            self.logger.error(f"Error in async write trades: {e}")
-            if hasattr(e, "message"):
-                self.logger.error(f"ClickHouse error message: {e.message}")
-            if hasattr(e, "args"):
-                self.logger.error(f"Error args: {e.args}")
             raise
+
+    async def _async_write_trades(self, columns: List[List[Any]]):
+        # Single columnar insert; values are sent as binary, not as SQL text.
+        # The driver is blocking, so run it off the event loop.
+        # Failures propagate to _insert, which logs them once.
+        if self.client and columns and len(columns[0]):
+            self.logger.debug("Executing batch insert for %d rows", len(columns[0]))
+            await asyncio.to_thread(
+                self.client.insert,
+                TABLE_NAME_TRADES,
+                columns,
+                column_names=TRADES_COLUMN_NAMES,
+                column_type_names=TRADES_COLUMN_TYPES,
+                column_oriented=True,
+            )
+            self.logger.info("Successful batch insert. Processed %d rows.", len(columns[0]))
     
     async def write_orders_batch(
         self, orders_data: List[Dict[str, Any]], symbol: str, account_name: str
@@ -117,85 +177,141 @@ class EventWriter:
             return
 
         try:
-            rows = []
-            # Transform raw Binance orders into a flat structure expected by ClickHouse
-            for order in orders_data:
-
-                row = {
-                    "avgPrice": float(order.get("avgPrice", 0.0)),
-                    "clientOrderId": order.get("clientOrderId", ""),
-                    "cumQuote": float(order.get("cumQuote", 0.0)),
-                    "executedQty": float(order.get("executedQty", 0.0)),
-                    "orderId": int(order.get("orderId", 0)),
-                    "origQty": float(order.get("origQty", 0.0)),
-                    "origType": order.get("origType", ""),
-                    "price": float(order.get("price", 0.0)),
-                    "reduceOnly": order.get("reduceOnly", False),
-                    "side": order.get("side", ""),
-                    "positionSide": order.get("positionSide", ""),
-                    "status": order.get("status", ""),
-                    "stopPrice": float(order.get("stopPrice", 0.0)),
-                    "closePosition": order.get("closePosition", False),
-                    "symbol": symbol,
-                    "time": int(order.get("time", 0)),
-                    "timeInForce": order.get("timeInForce", ""),
-                    "type": order.get("type", ""),
-                    "activatePrice": float(order.get("activatePrice", 0.0)),
-                    "priceRate": float(order.get("priceRate", 0.0)),
-                    "updateTime": int(order.get("updateTime", 0)),
-                    "workingType": order.get("workingType", ""),
-                    "priceProtect": order.get("priceProtect", False),
-                    "priceMatch": order.get("priceMatch", ""),
-                    "selfTradePreventionMode": order.get("selfTradePreventionMode", ""),
-                    "goodTillDate": int(order.get("goodTillDate", 0)),
-                    "name": account_name,
-                    # Same convention as for trades: raw time in ms plus a formatted datetime
-                    "date": datetime.fromtimestamp(
-                        int(order.get("time", 0)) / 1000
-                    ).strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                rows.append(row)
-
-            await self._async_write_orders(rows)
-
-            self.logger.info(
-                f"Successfully wrote {len(rows)} orders for {symbol} from {account_name}"
-            )
-
+            n = len(orders_data)
+            times = _time_column(orders_data)
+            # Transform raw Binance orders into one array per column (ORDERS_COLUMNS order)
+            columns = [
+                _float_column(orders_data, "avgPrice"),
+                [o.get("clientOrderId", "") for o in orders_data],
+                _float_column(orders_data, "cumQuote"),
+                _float_column(orders_data, "executedQty"),
+                _uint_column(orders_data, "orderId"),
+                _float_column(orders_data, "origQty"),
+                [o.get("origType", "") for o in orders_data],
+                _float_column(orders_data, "price"),
+                [o.get("reduceOnly", False) for o in orders_data],
+                [o.get("side", "") for o in orders_data],
+                [o.get("positionSide", "") for o in orders_data],
+                [o.get("status", "") for o in orders_data],
+                _float_column(orders_data, "stopPrice"),
+                [o.get("closePosition", False) for o in orders_data],
+                [symbol] * n,
+                times,
+                [o.get("timeInForce", "") for o in orders_data],
+                [o.get("type", "") for o in orders_data],
+                _float_column(orders_data, "activatePrice"),
+                _float_column(orders_data, "priceRate"),
+                _uint_column(orders_data, "updateTime"),
+                [o.get("workingType", "") for o in orders_data],
+                [o.get("priceProtect", False) for o in orders_data],
+                [o.get("priceMatch", "") for o in orders_data],
+                [o.get("selfTradePreventionMode", "") for o in orders_data],
+                _uint_column(orders_data, "goodTillDate"),
+                [account_name] * n,
+            ]
+
+            await self._enqueue(TABLE_NAME_ORDERS, columns, n)
+
+            self.logger.debug("Queued %d orders for %s from %s", n, symbol, account_name)
+
+        except FlushError:
+            raise
         except Exception as e:
+            # A skipped page would leave a gap behind later pages of the pair,
+            # so stop the pair instead and let the next run resume before it
             self.logger.error(f"Error writing orders batch for {symbol}: {e}")
+            raise
 
-    async def _async_write_orders(self, rows: List[Dict[str, Any]]):
+    async def _async_write_orders(self, columns: List[List[Any]]):
+        # Again, a single columnar insert for the whole page
+        if self.client and columns and len(columns[0]):
+            self.logger.debug("Executing batch insert for %d rows", len(columns[0]))
+            await asyncio.to_thread(
+                self.client.insert,
+                TABLE_NAME_ORDERS,
+                columns,
+                column_names=ORDERS_COLUMN_NAMES,
+                column_type_names=ORDERS_COLUMN_TYPES,
+                column_oriented=True,
+            )
+            self.logger.info("Successful batch insert. Processed %d rows.", len(columns[0]))
+    
+    async def _enqueue(self, table: str, columns: List[Any], rows: int):
+        """
+        Hand a page over to the flusher, starting it on first use.
+        Waits when the queue is full; the flusher stops draining it while the
+        previous insert is still running, so a slow ClickHouse pushes back on the collector.
+        """
+        if table in self._failed:
+            raise FlushError(f"Writes to {table} stopped: {self._failed[table]}")
+        if self._flusher is None:
+            self._queue = asyncio.Queue(maxsize=WRITER_QUEUE_SIZE)
+            self._flusher = asyncio.create_task(self._flush_loop(), name="ClickHouse flusher")
+        await self._queue.put((table, columns, rows))
+
+    async def _flush_loop(self):
+        """
+        Merge queued pages per table and insert them once WRITER_FLUSH_ROWS rows
+        are buffered or the oldest buffered page waited WRITER_FLUSH_INTERVAL seconds.
+        """
+        loop = asyncio.get_running_loop()
+        pending: Dict[str, List[List[Any]]] = {}
+        pending_rows: Dict[str, int] = {}
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _CLOSE:
+                for table in list(pending):
+                    await self._flush(table, pending, pending_rows)
+                return
+
+            if item is not None:
+                table, columns, rows = item
+                pending.setdefault(table, []).append(columns)
+                pending_rows[table] = pending_rows.get(table, 0) + rows
+                if deadline is None:
+                    deadline = loop.time() + WRITER_FLUSH_INTERVAL
+                if pending_rows[table] >= WRITER_FLUSH_ROWS:
+                    await self._flush(table, pending, pending_rows)
+
+            if deadline is not None and loop.time() >= deadline:
+                for table in list(pending):
+                    await self._flush(table, pending, pending_rows)
+            if not pending:
+                deadline = None
+
+    async def _flush(self, table: str, pending, pending_rows):
+        """
+        Start one insert for everything buffered for `table`.
+        Waits for the previous insert first: inserts never overlap, so pages
+        land in queue order while the next batch is merged in the background.
+        """
+        batches = pending.pop(table)
+        pending_rows.pop(table)
+        columns = _concat_columns(batches)
+        if self._inflight is not None:
+            await self._inflight
+        self._inflight = asyncio.create_task(self._insert(table, columns))
+
+    async def _insert(self, table: str, columns: List[Any]):
         try:
-            # Again, we batch everything into a single INSERT statement for performance
-            if self.client and rows:
-                values_parts = []
-                for row in rows:
-                    value_part = f"({row['avgPrice']}, '{row['clientOrderId']}', {row['cumQuote']}, {row['executedQty']}, {row['orderId']}, {row['origQty']}, '{row['origType']}', {row['price']}, {str(row['reduceOnly']).lower()}, '{row['side']}', '{row['positionSide']}', '{row['status']}', {row['stopPrice']}, {str(row['closePosition']).lower()}, '{row['symbol']}', {row['time']}, '{row['timeInForce']}', '{row['type']}', {row['activatePrice']}, {row['priceRate']}, {row['updateTime']}, '{row['workingType']}', {str(row['priceProtect']).lower()}, '{row['priceMatch']}', '{row['selfTradePreventionMode']}', {row['goodTillDate']}, '{row['name']}', '{row['date']}')"
-                    values_parts.append(value_part)
-
-                insert_sql = f"""
-                INSERT INTO {TABLE_NAME_ORDERS} (
-                    avgPrice, clientOrderId, cumQuote, executedQty, orderId, origQty, origType, 
-                    price, reduceOnly, side, positionSide, status, stopPrice, closePosition, 
-                    symbol, time, timeInForce, type, activatePrice, priceRate, updateTime, 
-                    workingType, priceProtect, priceMatch, selfTradePreventionMode, goodTillDate, 
-                    name, date
-                ) VALUES {', '.join(values_parts)}
-                """
-
-                self.logger.info(f"Executing batch insert for {len(rows)} rows")
-                _ = self.client.command(insert_sql)
-                self.logger.info(f"Successful batch insert. Processed {len(rows)} rows.")
-
+            if table in self._failed:
+                self.logger.error(
+                    "Dropping %d rows for %s after an earlier failed flush",
+                    len(columns[0]), table,
+                )
+                return
+            await self._inserters[table](columns)
         except Exception as e:
-            self.logger.error(f"Error in async write orders: {e}")
-            if hasattr(e, "message"):
-                self.logger.error(f"ClickHouse error message: {e.message}")
-            if hasattr(e, "args"):
-                self.logger.error(f"Error args: {e.args}")
-            raise
-    
+            self._failed[table] = e
+            self.logger.error(f"Error flushing batch into {table}, stopping its writes: {e}")
+
     async def get_last_from_id(self, symbol: str, account_name: str) -> int:
 
         try:
@@ -203,10 +319,12 @@ class EventWriter:
             query = f"""
             SELECT MAX(id) as last_from_id
             FROM {TABLE_NAME_TRADES}
-            WHERE symbol = '{symbol}' AND name = '{account_name}'
+            WHERE symbol = {{symbol:String}} AND name = {{name:String}}
             """
 
-            result = await self._async_query(query)
+            result = await self._async_query(
+                query, {"symbol": symbol, "name": account_name}
+            )
 
             if result and result[0][0]:
                 return int(result[0][0]) + 1
@@ -224,10 +342,12 @@ class EventWriter:
             query = f"""
             SELECT MAX(orderId) as last_order_id
             FROM {TABLE_NAME_ORDERS}
-            WHERE symbol = '{symbol}' AND name = '{account_name}'
+            WHERE symbol = {{symbol:String}} AND name = {{name:String}}
             """
 
-            result = await self._async_query(query)
+            result = await self._async_query(
+                query, {"symbol": symbol, "name": account_name}
+            )
 
             if result and result[0][0]:
                 return int(result[0][0]) + 1
@@ -238,16 +358,63 @@ class EventWriter:
             self.logger.error(f"Error getting last orderId for {symbol}: {e}")
             return 0
 
-    async def _async_query(self, query: str):
+    async def get_last_ids(
+        self, pairs: List[Tuple[str, str]], mode: ModeSpec
+    ) -> Optional[Dict[Tuple[str, str], int]]:
+        """
+        Resume ids for many (symbol, account) pairs in a single GROUP BY query.
+        Pairs without stored rows are absent from the result (resume from 0).
+        Returns None on failure so callers can fall back to per-pair lookups.
+        """
+
+        try:
+            query = f"""
+            SELECT symbol, name, MAX({mode.id_field}) as last_id
+            FROM {mode.table_name}
+            WHERE (symbol, name) IN {{pairs:Array(Tuple(String, String))}}
+            GROUP BY symbol, name
+            """
+
+            result = await self._async_query(query, {"pairs": pairs})
+
+            return {
+                (symbol, name): int(last_id) + 1
+                for symbol, name, last_id in result or []
+                if last_id
+            }
+
+        except Exception as e:
+            self.logger.error(f"Error getting last ids for {len(pairs)} pairs: {e}")
+            return None
+
+    async def _async_query(self, query: str, parameters: Optional[Dict[str, Any]] = None):
         try:
             if self.client:
-                result = self.client.query(query)
+                # {name:Type} placeholders are bound server side by ClickHouse
+                result = await asyncio.to_thread(
+                    self.client.query, query, parameters=parameters
+                )
                 return result.result_rows
         except Exception as e:
             self.logger.error(f"Error in async query: {e}")
             raise
 
+    async def aclose(self):
+        """
+        Flush everything still buffered, wait for running inserts, then close.
+        """
+        if self._flusher is not None:
+            await self._queue.put(_CLOSE)
+            await self._flusher
+            self._flusher = None
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+        self.close()
+
     def close(self):
         if self.client:
             self.client.close()
+            self._pool_mgr.clear()
+            self.client = None
             self.logger.info("ClickHouse connection closed")
@@ -1,12 +1,26 @@
-import json
 import asyncio
+import functools
+import orjson
 import sys
 from pathlib import Path
 from app.collector import Collector
 from app.config import Config
+from app.constants import MODES
+from app.logging_setup import configure_logging
 import logging
 
 
+@functools.lru_cache(maxsize=None)
+def load_config(path: Path, collection_type: str) -> Config:
+    """
+    Parse config.json once per (path, collection type).
+    The file may start with a UTF-8 BOM, which orjson does not accept.
+    """
+    return Config(
+        orjson.loads(path.read_bytes().removeprefix(b"\xef\xbb\xbf")), collection_type
+    )
+
+
 async def main_async(collection_type: str):
     """
     Entry point used by CLI and Docker.
@@ -16,8 +30,7 @@ async def main_async(collection_type: str):
     path = Path(__file__).parent.parent / "config.json"
 
     try:
-        with open(path, "r", encoding="utf-8-sig") as f:
-            conf = Config(json.load(f), collection_type)
+        conf = load_config(path, collection_type)
 
         logging.info(f"Starting collector with type: {collection_type}")
         
@@ -30,7 +43,7 @@ async def main_async(collection_type: str):
         logging.error(f"Configuration file not found: {path}")
         return
 
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
 
         logging.error(f"JSON convert error: {e}")
         return
@@ -44,14 +57,12 @@ def main():
     Small CLI wrapper:
     python -m src.main trades|orders
     """
+    configure_logging()
+
     if len(sys.argv) > 1:
-        arg = sys.argv[1].lower()
-        if arg == "trades":
-            collection_type = "trades"
-        elif arg == "orders":
-            collection_type = "orders"
-        else:
-            logging.error(f"Invalid collection type: {arg}. Use 'trades' or 'orders'")
+        collection_type = sys.argv[1].lower()
+        if collection_type not in MODES:
+            logging.error(f"Invalid collection type: {collection_type}. Use 'trades' or 'orders'")
             sys.exit(1)
     else:
         logging.error("Missing collection type. Use 'trades' or 'orders'")
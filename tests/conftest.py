@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app runs as `python src/main.py`, which puts src/ on the import path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
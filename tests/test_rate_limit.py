@@ -0,0 +1,66 @@
+import pytest
+
+from app.rate_limit import WeightLimiter
+
+
+class FakeTime:
+    """
+    Clock and sleep for WeightLimiter: sleeping advances the clock instead of waiting.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+@pytest.fixture
+def fake_time():
+    return FakeTime()
+
+
+@pytest.fixture
+def limiter(fake_time):
+    # 60 per minute refills one token per second
+    return WeightLimiter(capacity=60, clock=fake_time.clock, sleep=fake_time.sleep)
+
+
+class TestWeightLimiter:
+    async def test_acquire_within_budget_does_not_wait(self, limiter, fake_time):
+        for _ in range(12):
+            await limiter.acquire(5)
+        assert fake_time.sleeps == []
+
+    async def test_acquire_waits_for_refill(self, limiter, fake_time):
+        await limiter.acquire(60)
+        await limiter.acquire(5)
+        assert fake_time.sleeps == [pytest.approx(5.0)]
+        assert fake_time.now == pytest.approx(5.0)
+
+    async def test_refill_never_exceeds_capacity(self, limiter, fake_time):
+        fake_time.now += 3600
+        await limiter.acquire(60)
+        await limiter.acquire(1)
+        assert fake_time.sleeps == [pytest.approx(1.0)]
+
+    async def test_headers_shrink_bucket(self, limiter, fake_time):
+        limiter.update_from_headers({"X-MBX-USED-WEIGHT-1M": "55"})
+        await limiter.acquire(5)
+        await limiter.acquire(5)
+        assert fake_time.sleeps == [pytest.approx(5.0)]
+
+    async def test_headers_never_grow_bucket(self, limiter):
+        await limiter.acquire(50)
+        limiter.update_from_headers({"x-mbx-used-weight-1m": "0"})
+        assert limiter._tokens == pytest.approx(10.0)
+
+    def test_missing_headers_are_ignored(self, limiter):
+        limiter.update_from_headers(None)
+        limiter.update_from_headers({"Content-Type": "application/json"})
+        assert limiter._tokens == pytest.approx(60.0)
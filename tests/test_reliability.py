@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+from app.reliability import backoff_delay, retry, CircuitBreaker, CircuitOpenError
+
+
+class Sleeper:
+    """
+    Records backoff delays instead of sleeping through them.
+    """
+
+    def __init__(self):
+        self.delays = []
+
+    def sleep(self, delay):
+        self.delays.append(delay)
+
+    async def async_sleep(self, delay):
+        self.delays.append(delay)
+
+
+class Clock:
+    """
+    Manually advanced replacement for time.monotonic.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def sleeper():
+    return Sleeper()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+class TestBackoffDelay:
+    def test_without_jitter_doubles_up_to_cap(self):
+        delays = [backoff_delay(a, base=1.0, cap=10.0, jitter=None) for a in range(6)]
+        assert delays == [1.0, 2.0, 4.0, 8.0, 10.0, 10.0]
+
+    def test_full_jitter_stays_within_bounds(self):
+        for attempt in range(8):
+            assert 0.0 <= backoff_delay(attempt, 1.0, 30.0, "full") <= min(30.0, 2**attempt)
+
+    def test_equal_jitter_keeps_upper_half(self):
+        for attempt in range(8):
+            ceiling = min(30.0, 2**attempt)
+            assert ceiling / 2 <= backoff_delay(attempt, 1.0, 30.0, "equal") <= ceiling
+
+
+class TestRetry:
+    def test_sync_retries_until_success(self, sleeper):
+        calls = []
+
+        @retry(max_attempts=3, jitter=None, sleep=sleeper.sleep)
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("boom")
+            return "ok"
+
+        assert flaky() == "ok"
+        assert len(calls) == 3
+        assert sleeper.delays == [1.0, 2.0]
+
+    def test_sync_reraises_last_failure(self, sleeper):
+        calls = []
+
+        @retry(max_attempts=3, jitter=None, sleep=sleeper.sleep)
+        def broken():
+            calls.append(1)
+            raise ConnectionError(f"attempt {len(calls)}")
+
+        with pytest.raises(ConnectionError, match="attempt 3"):
+            broken()
+        assert len(calls) == 3
+
+    async def test_async_retries_until_success(self, sleeper):
+        calls = []
+
+        @retry(max_attempts=5, jitter=None, async_sleep=sleeper.async_sleep)
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 2:
+                raise asyncio.TimeoutError()
+            return "ok"
+
+        assert await flaky() == "ok"
+        assert len(calls) == 2
+        assert sleeper.delays == [1.0]
+
+    async def test_rejected_exceptions_are_not_retried(self, sleeper):
+        calls = []
+
+        @retry(
+            max_attempts=5,
+            retry_if=lambda e: isinstance(e, ConnectionError),
+            async_sleep=sleeper.async_sleep,
+        )
+        async def invalid():
+            calls.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            await invalid()
+        assert len(calls) == 1
+        assert sleeper.delays == []
+
+    def test_keeps_function_metadata(self):
+        @retry()
+        async def fetch_page():
+            """Docstring."""
+
+        assert fetch_page.__name__ == "fetch_page"
+        assert fetch_page.__doc__ == "Docstring."
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self, clock):
+        breaker = CircuitBreaker("acc", failure_threshold=3, reset_timeout=60, clock=clock)
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.check()
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+    def test_success_resets_failure_count(self, clock):
+        breaker = CircuitBreaker("acc", failure_threshold=3, reset_timeout=60, clock=clock)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_after_timeout_then_closes_on_success(self, clock):
+        breaker = CircuitBreaker("acc", failure_threshold=1, reset_timeout=60, clock=clock)
+        breaker.record_failure()
+        clock.now += 59
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+        clock.now += 1
+        breaker.check()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_trial_call_reopens(self, clock):
+        breaker = CircuitBreaker("acc", failure_threshold=5, reset_timeout=60, clock=clock)
+        for _ in range(5):
+            breaker.record_failure()
+        clock.now += 60
+        breaker.check()
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
@@ -0,0 +1,265 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app import writer
+from app.config import Config
+from app.constants import TABLE_NAME_TRADES, TABLE_NAME_ORDERS, TRADES_COLUMNS, ORDERS_COLUMNS
+from app.writer import EventWriter, FlushError
+
+
+class FakeClient:
+    """
+    Stands in for a clickhouse-connect client and records inserts.
+    """
+
+    def __init__(self):
+        self.inserts = []
+        self.fail_on = set()
+        self.delay = 0.0
+        self._lock = threading.Lock()
+        self._active = 0
+        self.peak = 0
+
+    def insert(self, table, data, column_names=None, column_type_names=None, column_oriented=False):
+        with self._lock:
+            number = len(self.inserts)
+            self.inserts.append(None)
+            self._active += 1
+            self.peak = max(self.peak, self._active)
+        try:
+            time.sleep(self.delay)
+            if number in self.fail_on:
+                raise RuntimeError("insert failed")
+            self.inserts[number] = (table, data, column_names, column_type_names)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def query(self, query, parameters=None):
+        raise AssertionError("unexpected query")
+
+    def close(self):
+        pass
+
+    @property
+    def stored(self):
+        return [insert for insert in self.inserts if insert is not None]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(writer.clickhouse_connect, "get_client", lambda **kwargs: fake)
+    return fake
+
+
+@pytest.fixture
+def config():
+    return Config(
+        {"credentials_accounts": [{"api_key": "k", "api_secret": "s", "name": "acc"}]},
+        "trades",
+    )
+
+
+def trades(first_id, count):
+    return [
+        {
+            "buyer": i % 2 == 0,
+            "commission": "0.01",
+            "commissionAsset": "USDT",
+            "id": first_id + i,
+            "price": "100.5",
+            "qty": "2",
+            "quoteQty": "201",
+            "realizedPnl": "-1.5",
+            "positionSide": "BOTH",
+            "time": 1700000000000 + i,
+        }
+        for i in range(count)
+    ]
+
+
+def stored_ids(client):
+    id_index = [name for name, _ in TRADES_COLUMNS].index("id")
+    return [int(i) for _, data, _, _ in client.stored for i in data[id_index]]
+
+
+async def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+class TestColumnLayout:
+    async def test_trades_columns_follow_trades_columns(self, client, config):
+        event_writer = EventWriter(config)
+        await event_writer.write_trades_batch(trades(7, 1), "BTCUSDT", "acc")
+        await event_writer.aclose()
+
+        (table, data, names, types), = client.stored
+        assert table == TABLE_NAME_TRADES
+        assert len(data) == len(TRADES_COLUMNS)
+        assert names == [name for name, _ in TRADES_COLUMNS]
+        assert types == [type_name for _, type_name in TRADES_COLUMNS]
+        row = {name: column[0] for name, column in zip(names, data)}
+        assert row == {
+            "buyer": True,
+            "commission": 0.01,
+            "commissionAsset": "USDT",
+            "id": 7,
+            "price": 100.5,
+            "qty": 2.0,
+            "quoteQTY": 201.0,
+            "realizedPnl": -1.5,
+            "positionSide": "BOTH",
+            "symbol": "BTCUSDT",
+            "name": "acc",
+            "time": 1700000000000,
+        }
+
+    async def test_orders_columns_follow_orders_columns(self, client, config):
+        order = {
+            "avgPrice": "10.5",
+            "clientOrderId": "cid",
+            "cumQuote": "21",
+            "executedQty": "2",
+            "orderId": 42,
+            "origQty": "3",
+            "origType": "LIMIT",
+            "price": "10",
+            "reduceOnly": True,
+            "side": "BUY",
+            "positionSide": "LONG",
+            "status": "FILLED",
+            "stopPrice": "9",
+            "closePosition": False,
+            "time": 1700000000000,
+            "timeInForce": "GTC",
+            "type": "LIMIT",
+            "activatePrice": "11",
+            "priceRate": "0.5",
+            "updateTime": 1700000000001,
+            "workingType": "CONTRACT_PRICE",
+            "priceProtect": True,
+            "priceMatch": "NONE",
+            "selfTradePreventionMode": "NONE",
+            "goodTillDate": 5,
+        }
+        event_writer = EventWriter(config)
+        await event_writer.write_orders_batch([order], "ETHUSDT", "acc")
+        await event_writer.aclose()
+
+        (table, data, names, types), = client.stored
+        assert table == TABLE_NAME_ORDERS
+        assert len(data) == len(ORDERS_COLUMNS)
+        assert names == [name for name, _ in ORDERS_COLUMNS]
+        assert types == [type_name for _, type_name in ORDERS_COLUMNS]
+        row = {name: column[0] for name, column in zip(names, data)}
+        expected = {key: value for key, value in order.items()}
+        expected.update(symbol="ETHUSDT", name="acc")
+        assert set(row) == set(expected)
+        for name, type_name in ORDERS_COLUMNS:
+            if type_name == "Float64":
+                assert row[name] == float(expected[name]), name
+            else:
+                assert row[name] == expected[name], name
+
+    async def test_numeric_columns_are_numpy_arrays(self, client, config):
+        event_writer = EventWriter(config)
+        await event_writer.write_trades_batch(trades(0, 3), "BTCUSDT", "acc")
+        await event_writer.aclose()
+
+        (_, data, names, _), = client.stored
+        columns = dict(zip(names, data))
+        assert columns["price"].dtype == np.float64
+        assert columns["id"].dtype == np.uint64
+        assert all(type(value) is int for value in columns["time"])
+
+    async def test_unparseable_decimal_raises(self, client, config):
+        event_writer = EventWriter(config)
+        page = trades(0, 1)
+        page[0]["price"] = "not a number"
+        with pytest.raises(ValueError):
+            await event_writer.write_trades_batch(page, "BTCUSDT", "acc")
+        await event_writer.aclose()
+        assert client.stored == []
+
+
+class TestFlushing:
+    async def test_pages_are_merged_and_flushed_on_close(self, client, config):
+        event_writer = EventWriter(config)
+        for first_id in (0, 5, 10):
+            await event_writer.write_trades_batch(trades(first_id, 5), "BTCUSDT", "acc")
+        await asyncio.sleep(0.05)
+        assert client.inserts == []
+
+        await event_writer.aclose()
+        assert len(client.stored) == 1
+        assert stored_ids(client) == list(range(15))
+
+    async def test_flushes_once_row_threshold_is_reached(self, client, config, monkeypatch):
+        monkeypatch.setattr(writer, "WRITER_FLUSH_ROWS", 10)
+        event_writer = EventWriter(config)
+        await event_writer.write_trades_batch(trades(0, 6), "BTCUSDT", "acc")
+        await event_writer.write_trades_batch(trades(6, 6), "BTCUSDT", "acc")
+        await wait_until(lambda: client.stored)
+        assert stored_ids(client) == list(range(12))
+        await event_writer.aclose()
+
+    async def test_flushes_after_interval(self, client, config, monkeypatch):
+        monkeypatch.setattr(writer, "WRITER_FLUSH_INTERVAL", 0.05)
+        event_writer = EventWriter(config)
+        await event_writer.write_trades_batch(trades(0, 3), "BTCUSDT", "acc")
+        await wait_until(lambda: client.stored)
+        assert stored_ids(client) == [0, 1, 2]
+        await event_writer.aclose()
+
+    async def test_inserts_run_one_at_a_time_in_queue_order(self, client, config, monkeypatch):
+        monkeypatch.setattr(writer, "WRITER_FLUSH_ROWS", 20)
+        client.delay = 0.01
+        event_writer = EventWriter(config)
+        for first_id in range(0, 500, 10):
+            await event_writer.write_trades_batch(trades(first_id, 10), "BTCUSDT", "acc")
+        await event_writer.aclose()
+
+        assert len(client.stored) > 1
+        assert client.peak == 1
+        assert stored_ids(client) == list(range(500))
+
+    async def test_queue_pushes_back_on_slow_inserts(self, client, config, monkeypatch):
+        monkeypatch.setattr(writer, "WRITER_FLUSH_ROWS", 1)
+        monkeypatch.setattr(writer, "WRITER_QUEUE_SIZE", 2)
+        client.delay = 0.2
+        event_writer = EventWriter(config)
+        producer = asyncio.create_task(
+            asyncio.wait_for(
+                asyncio.gather(
+                    *(event_writer.write_trades_batch(trades(i, 1), "BTCUSDT", "acc") for i in range(10))
+                ),
+                timeout=0.1,
+            )
+        )
+        with pytest.raises(asyncio.TimeoutError):
+            await producer
+        await event_writer.aclose()
+
+    async def test_failed_flush_stops_writes_to_the_table(self, client, config, monkeypatch):
+        monkeypatch.setattr(writer, "WRITER_FLUSH_ROWS", 5)
+        client.fail_on = {1}
+        client.delay = 0.02
+        event_writer = EventWriter(config)
+        # All three batches are queued before the second insert fails
+        for first_id in (0, 5, 10):
+            await event_writer.write_trades_batch(trades(first_id, 5), "BTCUSDT", "acc")
+        await wait_until(lambda: event_writer._failed)
+
+        with pytest.raises(FlushError):
+            await event_writer.write_trades_batch(trades(15, 5), "BTCUSDT", "acc")
+        await event_writer.aclose()
+        # Nothing is stored past the failed batch, so the resume id stays before it
+        assert stored_ids(client) == list(range(5))